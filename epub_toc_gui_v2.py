@@ -12,7 +12,10 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from pathlib import Path
 import threading
-import queue
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
 # ドラッグ&ドロップサポート
@@ -22,9 +25,29 @@ try:
 except ImportError:
     DND_SUPPORT = False
 
+# ドラッグ&ドロップ対応の有無はインポート時に確定するため、ここで処理を切り替える
+if DND_SUPPORT:
+    def _setup_dnd(gui):
+        """ドラッグ&ドロップの設定"""
+        gui.root.drop_target_register(DND_FILES)
+        gui.root.dnd_bind('<<Drop>>', gui.on_drop)
+    
+    def _create_drop_label(gui, parent):
+        """ドラッグ&ドロップエリアの作成"""
+        gui.drop_label = ttk.Label(parent, 
+                                   text="📎 EPUBファイルまたはフォルダをドラッグ&ドロップ",
+                                   style='Status.TLabel')
+        gui.drop_label.grid(row=1, column=0, columnspan=2, pady=(10, 0))
+else:
+    def _setup_dnd(gui):
+        """ドラッグ&ドロップ非対応時は何もしない"""
+    
+    def _create_drop_label(gui, parent):
+        """ドラッグ&ドロップ非対応時は何もしない"""
+
 # メインモジュールをインポート
 try:
-    from epubsplit_word_toc_v2 import SplitEpubWordTOC, BatchProcessor
+    from epubsplit_word_toc_v2 import SplitEpubWordTOC, BatchProcessor, open_epub_stream
     MODULE_AVAILABLE = True
 except ImportError:
     MODULE_AVAILABLE = False
@@ -40,8 +63,13 @@ class EpubTocGUI:
         
         # 変数
         self.processing = False
-        self.queue = queue.Queue()
+        self.cancel = threading.Event()  # 停止要求（ワーカーがファイル単位で確認）
+        self.queue = deque()  # ワーカー→GUIの単方向チャネル（append/popleftはスレッドセーフ）
         self.batch_processor = None
+        self._pool = None  # バッチ処理用のプロセスプール（初回使用時に生成）
+        self.max_log_lines = 2000  # ログエリアに保持する最大行数
+        self._last_ts_sec = 0  # ログのタイムスタンプ文字列キャッシュ（秒単位）
+        self._last_ts_str = ""
         
         # スタイル設定
         self.setup_styles()
@@ -50,11 +78,13 @@ class EpubTocGUI:
         self.create_widgets()
         
         # ドラッグ&ドロップ設定
-        if DND_SUPPORT:
-            self.setup_drag_drop()
+        _setup_dnd(self)
+        
+        # 終了時にワーカープールを解放
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
-        # キューチェック開始
-        self.check_queue()
+        # ワーカーからの通知でキューを処理（ポーリングしない）
+        self.root.bind("<<QueueReady>>", lambda e: self._drain_queue())
     
     def setup_styles(self):
         """スタイル設定"""
@@ -108,11 +138,7 @@ class EpubTocGUI:
         self.browse_button.grid(row=0, column=1)
         
         # ドラッグ&ドロップエリア
-        if DND_SUPPORT:
-            self.drop_label = ttk.Label(input_frame, 
-                                       text="📎 EPUBファイルまたはフォルダをドラッグ&ドロップ",
-                                       style='Status.TLabel')
-            self.drop_label.grid(row=1, column=0, columnspan=2, pady=(10, 0))
+        _create_drop_label(self, input_frame)
         
         # 出力設定
         output_frame = ttk.LabelFrame(main_frame, text="出力設定", padding="10")
@@ -120,32 +146,37 @@ class EpubTocGUI:
         
         # 出力ディレクトリ
         ttk.Label(output_frame, text="出力ディレクトリ:").grid(row=0, column=0, sticky=tk.W)
-        self.output_var = tk.StringVar(value=str(Path.cwd()))\n        output_entry = ttk.Entry(output_frame, textvariable=self.output_var, width=50)
+        self.output_var = tk.StringVar(value="")  # 空欄なら実行時のカレントディレクトリ
+        output_entry = ttk.Entry(output_frame, textvariable=self.output_var, width=50)
         output_entry.grid(row=0, column=1, padx=(10, 10))
         
         output_browse = ttk.Button(output_frame, text="参照", command=self.browse_output)
         output_browse.grid(row=0, column=2)
         
+        ttk.Label(output_frame, text="（空欄の場合はカレントディレクトリ）",
+                  style='Status.TLabel').grid(row=1, column=1, sticky=tk.W, padx=(10, 0))
+        
         # 出力形式
-        ttk.Label(output_frame, text="出力形式:").grid(row=1, column=0, sticky=tk.W, pady=(10, 0))
+        ttk.Label(output_frame, text="出力形式:").grid(row=2, column=0, sticky=tk.W, pady=(10, 0))
         self.format_var = tk.StringVar(value="both")
         format_combo = ttk.Combobox(output_frame, textvariable=self.format_var, 
                                    values=["both", "text", "word"], state="readonly", width=15)
-        format_combo.grid(row=1, column=1, sticky=tk.W, padx=(10, 0), pady=(10, 0))
+        format_combo.grid(row=2, column=1, sticky=tk.W, padx=(10, 0), pady=(10, 0))
         
         # バッチ処理設定
         self.batch_frame = ttk.LabelFrame(main_frame, text="バッチ処理設定", padding="10")
         self.batch_frame.grid(row=4, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 15))
         
         ttk.Label(self.batch_frame, text="並列実行数:").grid(row=0, column=0, sticky=tk.W)
-        self.workers_var = tk.StringVar(value="4")
-        workers_spin = ttk.Spinbox(self.batch_frame, from_=1, to=8, 
+        cpu_count = os.cpu_count() or 1
+        self.workers_var = tk.StringVar(value=str(cpu_count))
+        workers_spin = ttk.Spinbox(self.batch_frame, from_=1, to=max(8, cpu_count), 
                                   textvariable=self.workers_var, width=10)
         workers_spin.grid(row=0, column=1, sticky=tk.W, padx=(10, 0))
         
-        recursive_var = tk.BooleanVar(value=True)
+        self.recursive_var = tk.BooleanVar(value=True)
         recursive_check = ttk.Checkbutton(self.batch_frame, text="サブフォルダも検索", 
-                                         variable=recursive_var)
+                                         variable=self.recursive_var)
         recursive_check.grid(row=0, column=2, padx=(20, 0))
         
         # 実行ボタン
@@ -163,11 +194,12 @@ class EpubTocGUI:
         self.stop_button.pack(side=tk.LEFT)
         
         # プログレスバー
-        self.progress = ttk.Progressbar(main_frame, mode='indeterminate')
+        self.progress = ttk.Progressbar(main_frame, mode='determinate')
         self.progress.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
         
         # ステータス
-        self.status_var = tk.StringVar(value="Ready")\n        status_label = ttk.Label(main_frame, textvariable=self.status_var, style='Status.TLabel')
+        self.status_var = tk.StringVar(value="Ready")
+        status_label = ttk.Label(main_frame, textvariable=self.status_var, style='Status.TLabel')
         status_label.grid(row=7, column=0, columnspan=3)
         
         # ログエリア
@@ -178,6 +210,10 @@ class EpubTocGUI:
                                                  font=('Consolas', 9))
         self.log_text.pack(fill=tk.BOTH, expand=True)
         
+        # 結果表示バナー（モーダルダイアログでメインループを止めないため）
+        self.banner = ttk.Label(main_frame, style='Status.TLabel')
+        self.banner.grid(row=9, column=0, columnspan=3, sticky=tk.W, pady=(10, 0))
+        
         # グリッドの重みを設定
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
@@ -187,11 +223,6 @@ class EpubTocGUI:
         # 初期状態設定
         self.on_mode_change()
     
-    def setup_drag_drop(self):
-        """ドラッグ&ドロップの設定"""
-        self.root.drop_target_register(DND_FILES)
-        self.root.dnd_bind('<<Drop>>', self.on_drop)
-    
     def on_drop(self, event):
         """ドラッグ&ドロップ処理"""
         files = self.root.tk.splitlist(event.data)
@@ -239,6 +270,9 @@ class EpubTocGUI:
     
     def start_processing(self):
         """処理開始"""
+        if self.processing:
+            return
+        
         if not MODULE_AVAILABLE:
             messagebox.showerror("エラー", "必要なモジュールがインストールされていません")
             return
@@ -252,13 +286,19 @@ class EpubTocGUI:
             messagebox.showerror("エラー", "指定されたパスが存在しません")
             return
         
-        # UI状態更新
         self.processing = True
-        self.process_button.configure(state='disabled')
-        self.stop_button.configure(state='normal')
-        self.progress.configure(mode='indeterminate')
-        self.progress.start()
+        self.cancel.clear()
+        
+        # UI更新はアイドル時にまとめて行い、その後でワーカーを開始する
+        self.root.after_idle(self._apply_start_state)
+    
+    def _apply_start_state(self):
+        """処理開始時のUI状態をまとめて反映し、別スレッドで処理を開始"""
+        self.process_button['state'] = 'disabled'
+        self.stop_button['state'] = 'normal'
+        self.progress.configure(mode='determinate', maximum=1, value=0)
         self.status_var.set("処理中...")
+        self.banner.configure(text="", style='Status.TLabel')
         
         # ログクリア
         self.log_text.delete(1.0, tk.END)
@@ -272,103 +312,193 @@ class EpubTocGUI:
         """ファイル処理（別スレッド）"""
         try:
             input_path = Path(self.input_var.get())
-            output_dir = self.output_var.get()
+            output_dir = self.output_var.get().strip() or os.fspath(Path.cwd())
             format_type = self.format_var.get()
             
             if self.mode_var.get() == "single":
                 # 単一ファイル処理
-                self.queue.put(("log", f"📚 ファイル処理: {input_path.name}"))
+                self._put(("log", f"📚 ファイル処理: {input_path.name}"))
                 
-                with open(input_path, 'rb') as f:
-                    epub_splitter = SplitEpubWordTOC(f)
-                    results = epub_splitter.generate_word_toc_output(
-                        output_dir=output_dir,
-                        format_type=format_type
-                    )
+                epub_splitter = SplitEpubWordTOC(open_epub_stream(input_path))
+                results = epub_splitter.generate_word_toc_output(
+                    output_dir=output_dir,
+                    format_type=format_type
+                )
                 
-                self.queue.put(("log", "✅ 処理完了!"))
+                self._put(("progress", (1, 1)))
+                self._put(("log", "✅ 処理完了!"))
                 for format_name, file_path in results.items():
-                    self.queue.put(("log", f"   📄 {format_name}: {Path(file_path).name}"))
+                    self._put(("log", f"   📄 {format_name}: {Path(file_path).name}"))
                 
-                self.queue.put(("complete", "単一ファイルの処理が完了しました"))
+                self._put(("complete", "単一ファイルの処理が完了しました"))
                 
             else:
                 # バッチ処理
                 workers = int(self.workers_var.get())
-                self.queue.put(("log", f"🔄 バッチ処理開始: {input_path}"))
-                self.queue.put(("log", f"⚙️ 並列実行数: {workers}"))
+                self._put(("log", f"🔄 バッチ処理開始: {input_path}"))
+                self._put(("log", f"⚙️ 並列実行数: {workers}"))
                 
-                self.batch_processor = BatchProcessor(max_workers=workers)
-                results = self.batch_processor.process_directory(
+                self.batch_processor = BatchProcessor(max_workers=workers,
+                                                      executor=self._get_pool(workers))
+                # 完了したファイルから順にログへ反映
+                success_count = error_count = 0
+                for result in self.batch_processor.iter_directory(
                     str(input_path),
                     output_dir=output_dir,
-                    format_type=format_type
-                )
-                
-                success_count = len([r for r in results if r['status'] == 'success'])
-                error_count = len([r for r in results if r['status'] == 'error'])
+                    format_type=format_type,
+                    recursive=self.recursive_var.get(),
+                    cancel_event=self.cancel
+                ):
+                    done_count = success_count + error_count + 1
+                    # 走査が続いている間は総数が未確定なのでNoneを送る（結果は走査完了前から届く）
+                    processor = self.batch_processor
+                    self._put(("progress", (done_count,
+                                            processor.discovered if processor.discovery_done else None)))
+                    file_name = Path(result['file']).name
+                    if result['status'] == 'success':
+                        success_count += 1
+                        self._put(("log", f"✅ {file_name}"))
+                    else:
+                        error_count += 1
+                        self._put(("log", f"❌ {file_name}: {result['error']}"))
+                    
+                    if self.cancel.is_set():
+                        break
                 
-                self.queue.put(("log", f"📊 バッチ処理完了:"))
-                self.queue.put(("log", f"   ✅ 成功: {success_count}ファイル"))
-                self.queue.put(("log", f"   ❌ エラー: {error_count}ファイル"))
+                if self.cancel.is_set():
+                    self._put(("log", "⏹ 処理を停止しました"))
                 
-                if error_count > 0:
-                    self.queue.put(("log", f"❌ エラー詳細:"))
-                    for error in self.batch_processor.errors[:3]:
-                        self.queue.put(("log", f"   - {error}"))
+                self._put(("log", f"📊 バッチ処理完了:"))
+                self._put(("log", f"   ✅ 成功: {success_count}ファイル"))
+                self._put(("log", f"   ❌ エラー: {error_count}ファイル"))
                 
-                self.queue.put(("complete", f"バッチ処理が完了しました（{success_count}件成功）"))
+                self._put(("complete", f"バッチ処理が完了しました（{success_count}件成功）"))
                 
-        except Exception as e:
-            self.queue.put(("error", f"処理エラー: {str(e)}"))
+        except Exception:
+            # メッセージだけでなくトレースバックをログに残す（例外発生箇所に近い内側の5フレーム）
+            self._put(("log", traceback.format_exc(limit=-5)))
+            self._put(("error", "処理エラー"))
         finally:
-            self.queue.put(("finished", None))
+            self._put(("finished", None))
+    
+    def _get_pool(self, workers):
+        """並列実行数に合わせたプロセスプールを取得（同じ設定なら再利用）
+        
+        EPUB解析はCPUバウンドでGILの影響を受けるため、ファイル単位で別プロセスに分散する
+        """
+        # ワーカーが異常終了したプール（BrokenProcessPool）は以後使えないので作り直す
+        if (self._pool is None or self._pool._max_workers != workers
+                or getattr(self._pool, '_broken', False)):
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+            self._pool = ProcessPoolExecutor(max_workers=workers)
+        return self._pool
+    
+    def on_close(self):
+        """ウィンドウ終了時の処理"""
+        # 先に停止要求を出し、待機中のファイルは取り消して終了時に処理を待たない
+        self.cancel.set()
+        if self._pool is not None:
+            if sys.version_info >= (3, 9):
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            else:
+                self._pool.shutdown(wait=False)
+        self.root.destroy()
     
     def stop_processing(self):
-        """処理停止"""
-        self.processing = False
-        self.queue.put(("log", "⏹ 処理を停止しました"))
-        self.queue.put(("finished", None))
+        """処理停止（実行中のファイルの完了を待ってワーカーが終了する）"""
+        self.cancel.set()
+        self.stop_button.configure(state='disabled')
+        self._put(("log", "⏹ 停止要求を受け付けました。実行中のファイルの完了を待っています..."))
     
-    def check_queue(self):
-        """キューチェック"""
+    def _put(self, msg):
+        """キューにメッセージを追加してメインループに通知"""
+        self.queue.append(msg)
         try:
-            while True:
-                msg_type, msg_data = self.queue.get_nowait()
-                
-                if msg_type == "log":
-                    self.log(msg_data)
-                elif msg_type == "complete":
-                    self.status_var.set(msg_data)
-                    messagebox.showinfo("完了", msg_data)
-                elif msg_type == "error":
-                    self.status_var.set(msg_data)
-                    messagebox.showerror("エラー", msg_data)
-                elif msg_type == "finished":
-                    self.finish_processing()
-                    break
-                    
-        except queue.Empty:
-            pass
-        
-        # 100ms後に再チェック
-        self.root.after(100, self.check_queue)
+            self.root.event_generate("<<QueueReady>>", when="tail")
+        except (tk.TclError, RuntimeError):
+            pass  # ウィンドウ終了後の通知は無視
+    
+    def _drain_queue(self):
+        """キュー処理（溜まったログはまとめて1回で反映）"""
+        # ループ内で使う属性・メソッドはローカルに束縛しておく
+        queue = self.queue
+        get = queue.popleft
+        format_log = self._format_log
+        pending_logs = []
+        add_log = pending_logs.append
+        while queue:
+            msg_type, msg_data = get()
+            
+            if msg_type == "log":
+                add_log(format_log(msg_data))
+                continue
+            
+            # ログ以外のメッセージの前に、それまでのログを反映しておく
+            if pending_logs:
+                self._write_log(pending_logs)
+                pending_logs.clear()
+            
+            if msg_type == "progress":
+                done, total = msg_data
+                if total is None:
+                    # 総数が確定するまでは最大値を出さず、処理件数だけ表示する
+                    if self.progress['mode'] != 'indeterminate':
+                        self.progress.configure(mode='indeterminate')
+                    self.progress.step()
+                    self.status_var.set(f"処理中... {done}件（ファイル検索中）")
+                else:
+                    self.progress.configure(mode='determinate', maximum=max(total, done, 1), value=done)
+                    self.status_var.set(f"処理中... {done}/{total}")
+            elif msg_type == "complete":
+                self.status_var.set(msg_data)
+                self.banner.configure(text=f"✅ {msg_data}", style='Success.TLabel')
+            elif msg_type == "error":
+                self.status_var.set(msg_data)
+                self.banner.configure(text=f"❌ {msg_data}", style='Error.TLabel')
+            elif msg_type == "finished":
+                self.finish_processing()
+                break
+        
+        if pending_logs:
+            self._write_log(pending_logs)
     
     def log(self, message):
         """ログ出力"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {message}\\n"
-        self.log_text.insert(tk.END, log_message)
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        self._write_log([self._format_log(message)])
+    
+    def _format_log(self, message):
+        """タイムスタンプ付きのログ行を作成"""
+        # 同じ秒のうちは整形済みの文字列を再利用
+        sec = int(time.time())
+        if sec != self._last_ts_sec:
+            self._last_ts_sec = sec
+            self._last_ts_str = time.strftime("%H:%M:%S", time.localtime(sec))
+        return f"[{self._last_ts_str}] {message}\n"
+    
+    def _write_log(self, lines):
+        """複数のログ行をまとめてテキストウィジェットに追加"""
+        log_text = self.log_text
+        end = tk.END
+        log_text.insert(end, "".join(lines))
+        
+        # 古い行を削除してウィジェットの肥大化を防ぐ
+        line_count = int(log_text.index('end-1c').split('.')[0])
+        if line_count > self.max_log_lines:
+            log_text.delete('1.0', f'{line_count - self.max_log_lines}.0')
+        
+        log_text.see(end)
     
     def finish_processing(self):
         """処理終了時の後処理"""
         self.processing = False
-        self.process_button.configure(state='normal')
-        self.stop_button.configure(state='disabled')
-        self.progress.stop()
-        self.progress.configure(mode='determinate', value=0)
+        self.root.after_idle(self._apply_finish_state)
+    
+    def _apply_finish_state(self):
+        """処理終了時のUI状態をまとめて反映"""
+        self.process_button['state'] = 'normal'
+        self.stop_button['state'] = 'disabled'
+        self.progress.configure(value=0)
         
         if not self.status_var.get().startswith("✅") and not self.status_var.get().startswith("❌"):
             self.status_var.set("Ready")
@@ -396,7 +526,7 @@ def main():
         root.mainloop()
         
     except Exception as e:
-        messagebox.showerror("起動エラー", f"アプリケーションの起動に失敗しました:\\n{str(e)}")
+        messagebox.showerror("起動エラー", f"アプリケーションの起動に失敗しました:\n{str(e)}")
 
 if __name__ == "__main__":
     main()
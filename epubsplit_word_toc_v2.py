@@ -6,11 +6,14 @@ __copyright__ = '2025, Enhanced Word TOC Output for Japan v2.0'
 __docformat__ = 'restructuredtext en'
 __version__ = '2.0.0'
 
-import sys, re, os, traceback, copy, glob
+import sys, re, os, io, codecs, mmap, traceback, copy, glob
 from posixpath import normpath
 import logging
+import functools
+import importlib.util
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
 import chardet
 
 # Progress bar support
@@ -23,27 +26,70 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
-from xml.dom.minidom import parse, parseString, getDOMImplementation, Element
 from time import time
 from datetime import datetime
 
-import six
-from six.moves.urllib.parse import unquote
-from six import string_types, text_type as unicode
-from six import unichr
-
-from bs4 import BeautifulSoup
+# HTMLはlxml.htmlのC実装ツリーとXPathで解析する（BeautifulSoupのTagラッパーを作らない）
+from lxml import etree
+from lxml import html as lhtml
 
 # Word document generation support
-try:
-    from docx import Document
-    from docx.shared import Inches, Pt
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
-    WORD_SUPPORT = True
-except ImportError:
-    WORD_SUPPORT = False
+# python-docxの読み込みは重いので、ここでは有無だけ確認し実際のimportはWord出力時に行う
+WORD_SUPPORT = importlib.util.find_spec('docx') is not None
+if not WORD_SUPPORT:
     print("python-docx not available. Word output will be disabled.")
 
+# 見出しテキストのクリーニング用パターン
+_RE_WS = re.compile(r'\s+')
+_RE_CHAPTER_PREFIX = re.compile(r'^第(\d+)章\s*')
+_RE_NUMBER_PREFIX = re.compile(r'^(\d+)\.\s*')
+# ヒューリスティック分類表: パターン名 -> (レベル, 最大文字数, タグ)
+_HEURISTIC_LEVELS = {
+    'chapter': ('level1', 100, 'heuristic_h1'),
+    'section': ('level2', 80, 'heuristic_h2'),
+    'subsection': ('level3', 60, 'heuristic_h3'),
+}
+
+# レベルごとの見出し検出対象: (見出しタグ, divのclass名)
+_LEVEL_SELECTORS = {
+    'level1': ('h1', ('chapter', 'section1')),
+    'level2': ('h2', ('section', 'section2')),
+    'level3': ('h3', ('subsection', 'section3')),
+}
+
+def _level_xpath(tag, classes):
+    """見出しタグとclass指定のdivを1本のXPathに結合（classはCSSのdiv.xxxと同じくトークン一致）"""
+    return '|'.join([f'//{tag}'] + [
+        f'//div[contains(concat(" ", normalize-space(@class), " "), " {name} ")]'
+        for name in classes
+    ])
+
+# XML宣言のエンコーディング指定
+_RE_XML_ENCODING = re.compile(rb'encoding=["\']([^"\']+)')
+# HTMLのmetaによる文字コード指定（lxml.htmlはこちらは解釈する）
+_RE_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=', re.IGNORECASE)
+_BOMS = (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+def _sniff_html_encoding(data):
+    """バイト列のHTMLの文字コードを判定（lxmlの判定に任せてよい場合はNone）
+    
+    lxml.htmlは宣言がないとLatin-1として読むので、XML宣言の指定を拾い、
+    宣言がなければUTF-8として読めるか、だめならchardetで判定する
+    """
+    if data.startswith(_BOMS):
+        return None
+    declared = _RE_XML_ENCODING.search(data, 0, 100)
+    if declared:
+        return declared.group(1).decode('ascii', 'replace')
+    if _RE_META_CHARSET.search(data, 0, 2048):
+        return None
+    try:
+        data.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    return chardet.detect(data[:4096])['encoding']
+
 class CalibreCompatibleTOCDetector:
     """
     Calibre互換の目次検出クラス
@@ -64,161 +110,348 @@ class CalibreCompatibleTOCDetector:
             'section': re.compile(r'(\d+\.\d+|\d+－\d+|§\d+)', re.IGNORECASE),
             'subsection': re.compile(r'(\d+\.\d+\.\d+|\(\d+\))', re.IGNORECASE)
         }
+        
+        # 上記3パターンを1つに結合（先読みの選択肢を章→節→小節の順に試すので、
+        # 個別にsearchした場合と同じ優先順位を1回のmatchで判定できる）
+        self._heuristic_re = re.compile(
+            '|'.join(f'(?=.*?(?P<{name}>{pattern.pattern}))'
+                     for name, pattern in self.heuristic_patterns.items()),
+            re.IGNORECASE | re.DOTALL
+        )
+    
+        # 各レベルのパターンを1本のXPathにまとめて事前コンパイル
+        self._level_xpaths = {
+            level: etree.XPath(_level_xpath(tag, classes))
+            for level, (tag, classes) in _LEVEL_SELECTORS.items()
+        }
+        # 直下に文字を持たずブロック要素（p/div）を包むだけの要素は、子要素の側で判定されるので除外する
+        # （章全体を包むdivのテキストを丸ごと組み立てないため）。spanだけを含む要素は
+        # 見出しがインライン要素に分かれている場合があるので除外しない
+        self._paragraph_xpath = etree.XPath(
+            '(//p|//div|//span)[text()[normalize-space()] or not(p|div)]'
+        )
     
     def detect_toc_from_html(self, html_content):
         """HTMLコンテンツから目次構造を検出"""
-        soup = BeautifulSoup(html_content, 'lxml')
         detected_toc = {'level1': [], 'level2': [], 'level3': []}
+        tree = self._parse_html(html_content)
+        if tree is None:
+            return detected_toc
         
-        # XPath式に相当するCSS Selectorで検出
-        for level, patterns in [('level1', ['h1', 'div.chapter', 'div.section1']),
-                               ('level2', ['h2', 'div.section', 'div.section2']),
-                               ('level3', ['h3', 'div.subsection', 'div.section3'])]:
-            
-            for pattern in patterns:
-                elements = soup.select(pattern)
-                for elem in elements:
-                    text = elem.get_text().strip()
-                    if text and len(text) > 1:
-                        detected_toc[level].append({
-                            'text': self._clean_heading_text(text),
-                            'tag': elem.name,
-                            'position': self._get_element_position(elem)
-                        })
+        # XPath式で検出（レベルごとに1回のextendでまとめて追加）
+        clean = self._clean_heading_text
+        for level, xpath in self._level_xpaths.items():
+            found = ((elem.text_content().strip(), elem) for elem in xpath(tree))
+            detected_toc[level].extend(
+                {'text': clean(text), 'tag': elem.tag, 'position': elem.sourceline}
+                for text, elem in found if len(text) > 1
+            )
         
         # ヒューリスティック検出
-        self._apply_heuristic_detection(soup, detected_toc)
+        candidates = ((para.text_content().strip(), para.sourceline)
+                      for para in self._paragraph_xpath(tree))
+        self._apply_heuristic_detection(candidates, detected_toc)
         
         return detected_toc
     
-    def _clean_heading_text(self, text):
-        """見出しテキストのクリーニング"""
+    def _parse_html(self, html_content):
+        """lxml.htmlでHTMLを解析してルート要素を返す（空の場合はNone）"""
+        try:
+            if isinstance(html_content, str):
+                # 文字列はエンコーディング宣言付きだと解析できないため、UTF-8のバイト列として渡す
+                parser = lhtml.HTMLParser(encoding='utf-8')
+                return lhtml.document_fromstring(html_content.encode('utf-8'), parser=parser)
+            encoding = _sniff_html_encoding(html_content)
+            if encoding:
+                try:
+                    parser = lhtml.HTMLParser(encoding=encoding)
+                except LookupError:
+                    parser = None  # lxmlが知らない文字コード名は宣言を無視して解析
+                if parser is not None:
+                    return lhtml.document_fromstring(html_content, parser=parser)
+            return lhtml.document_fromstring(html_content)
+        except etree.ParserError:
+            pass
+        return self._parse_html_with_soup(html_content)
+    
+    def _parse_html_with_soup(self, html_content):
+        """lxml.htmlが解析できなかった場合だけsoupparser（BeautifulSoup）で再試行"""
+        if isinstance(html_content, bytes):
+            html_content = html_content.decode('utf-8', 'replace')
+        if not html_content.strip():
+            return None
+        try:
+            from lxml.html import soupparser
+            return soupparser.fromstring(html_content)
+        except Exception:
+            # BeautifulSoupが未インストール、またはsoupparserでも解析できない
+            return None
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def _clean_heading_text(text):
+        """見出しテキストのクリーニング（柱やTOCの繰り返し見出しはキャッシュから返す）"""
         # 不要な文字の除去
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = _RE_WS.sub(' ', text).strip()
         # 日本語特有のパターン正規化
-        text = re.sub(r'^第(\d+)章\s*', r'第\1章　', text)
-        text = re.sub(r'^(\d+)\.\s*', r'\1. ', text)
+        text = _RE_CHAPTER_PREFIX.sub(r'第\1章　', text)
+        text = _RE_NUMBER_PREFIX.sub(r'\1. ', text)
         return text
     
-    def _get_element_position(self, element):
-        """要素のドキュメント内位置を取得"""
-        # BeautifulSoupでの概算位置
-        return len(str(element.encode_contents()))
-    
-    def _apply_heuristic_detection(self, soup, detected_toc):
-        """Calibre風ヒューリスティック検出"""
-        all_paragraphs = soup.find_all(['p', 'div', 'span'])
-        
-        for para in all_paragraphs:
-            text = para.get_text().strip()
+    def _apply_heuristic_detection(self, candidates, detected_toc):
+        """Calibre風ヒューリスティック検出（candidatesは(テキスト, 位置)の列）"""
+        heuristic_match = self._heuristic_re.match
+        for text, position in candidates:
             if not text:
                 continue
-                
-            # パターンマッチング
-            if self.heuristic_patterns['chapter'].search(text):
-                if len(text) < 100:  # 長すぎるものは除外
-                    detected_toc['level1'].append({
-                        'text': self._clean_heading_text(text),
-                        'tag': 'heuristic_h1',
-                        'position': self._get_element_position(para)
-                    })
-            elif self.heuristic_patterns['section'].search(text):
-                if len(text) < 80:
-                    detected_toc['level2'].append({
-                        'text': self._clean_heading_text(text),
-                        'tag': 'heuristic_h2',
-                        'position': self._get_element_position(para)
-                    })
-            elif self.heuristic_patterns['subsection'].search(text):
-                if len(text) < 60:
-                    detected_toc['level3'].append({
-                        'text': self._clean_heading_text(text),
-                        'tag': 'heuristic_h3',
-                        'position': self._get_element_position(para)
-                    })
+            
+            # パターンマッチング（どのパターンに該当したかはlastgroupで判定）
+            match = heuristic_match(text)
+            if match is None:
+                continue
+            level_key, max_length, tag = _HEURISTIC_LEVELS[match.lastgroup]
+            if len(text) < max_length:  # 長すぎるものは除外
+                detected_toc[level_key].append({
+                    'text': self._clean_heading_text(text),
+                    'tag': tag,
+                    'position': position
+                })
 
 class BatchProcessor:
     """バッチ処理クラス - 複数ファイルの一括処理"""
     
-    def __init__(self, max_workers=4):
+    def __init__(self, max_workers=4, executor=None):
         self.max_workers = max_workers
+        # 外部から渡されたExecutorは呼び出し側が管理する（毎回スレッドを生成しない）
+        self.executor = executor
+        self.discovered = 0  # 検出済みEPUBファイル数（進捗表示用）
+        self.discovery_done = False  # ディレクトリ走査が終わり、discoveredが総数として確定したか
         self.results = []
         self.errors = []
     
     def process_directory(self, directory_path, output_dir=".", format_type="both", recursive=True):
         """ディレクトリ内のEPUBファイルを一括処理"""
-        epub_files = self._find_epub_files(directory_path, recursive)
+        # 全件の列挙を待たず、見つかったファイルから順に投入する
+        self.discovered = 0
+        epub_files = self._iter_epubs(directory_path, recursive)
+        error_count = 0
+        
+        # プログレスバー付きバッチ処理（走査中は件数のみ表示し、総数は走査完了後に設定）
+        pbar = tqdm(total=None, desc="EPUB処理中") if PROGRESS_SUPPORT else None
+        try:
+            for i, result in enumerate(self._iter_results(epub_files, output_dir, format_type), 1):
+                self.results.append(result)
+                if result['status'] == 'error':
+                    error_count += 1
+                if pbar is not None:
+                    if self.discovery_done and pbar.total is None:
+                        pbar.total = self.discovered
+                    pbar.update(1)
+                else:
+                    print(f"処理済み... {i}/{self.discovered}: {Path(result['file']).name}")
+                    if result['status'] == 'error':
+                        print(f"❌ エラー: {result['error']}")
+        finally:
+            if pbar is not None:
+                pbar.close()
         
-        if not epub_files:
+        if not self.discovered:
             print(f"📁 {directory_path} にEPUBファイルが見つかりませんでした")
             return []
         
-        print(f"📚 {len(epub_files)}個のEPUBファイルを検出しました")
-        
-        # プログレスバー付きバッチ処理
-        if PROGRESS_SUPPORT:
-            with tqdm(total=len(epub_files), desc="EPUB処理中") as pbar:
-                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                    futures = []
-                    for epub_file in epub_files:
-                        future = executor.submit(self._process_single_epub, epub_file, output_dir, format_type)
-                        futures.append(future)
-                    
-                    for future in futures:
-                        try:
-                            result = future.result()
-                            self.results.append(result)
-                            pbar.update(1)
-                        except Exception as e:
-                            self.errors.append(str(e))
-                            pbar.update(1)
-        else:
-            # プログレスバーなしの処理
-            for i, epub_file in enumerate(epub_files, 1):
-                print(f"処理中... {i}/{len(epub_files)}: {Path(epub_file).name}")
-                try:
-                    result = self._process_single_epub(epub_file, output_dir, format_type)
-                    self.results.append(result)
-                except Exception as e:
-                    self.errors.append(str(e))
-                    print(f"❌ エラー: {e}")
-        
+        # 走査と処理は並行して進むので、件数は処理完了後のまとめとして表示する
+        print(f"📚 {self.discovered}個のEPUBファイルを処理しました"
+              f"（成功: {self.discovered - error_count}件 / エラー: {error_count}件）")
         return self.results
     
-    def _find_epub_files(self, directory_path, recursive=True):
-        """EPUBファイルを検索"""
-        directory = Path(directory_path)
-        if not directory.exists():
-            return []
+    def iter_directory(self, directory_path, output_dir=".", format_type="both", recursive=True,
+                       cancel_event=None):
+        """ディレクトリ内のEPUBファイルを処理し、完了したものから順に結果を返す
         
-        if recursive:
-            return list(directory.rglob("*.epub"))
+        cancel_event（threading.Event）がセットされると、未着手のファイルは処理せずに終了する
+        """
+        # 検出しながら投入するので、走査中のファイルと並行して解析が始まる
+        self.discovered = 0
+        epub_files = self._iter_epubs(directory_path, recursive)
+        yield from self._iter_results(epub_files, output_dir, format_type, cancel_event)
+    
+    def _iter_results(self, epub_files, output_dir, format_type, cancel_event=None):
+        """Executorにファイルを投入し、完了順に結果を返す"""
+        if self.executor is not None:
+            yield from self._iter_completed(self.executor, epub_files, output_dir, format_type,
+                                            cancel_event)
         else:
-            return list(directory.glob("*.epub"))
+            # 解析はCPUバウンドのため、GILを避けてファイル単位でプロセスに分散する
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                yield from self._iter_completed(executor, epub_files, output_dir, format_type,
+                                                cancel_event)
     
-    def _process_single_epub(self, epub_path, output_dir, format_type):
-        """単一EPUBファイルの処理"""
+    def _iter_completed(self, executor, epub_files, output_dir, format_type, cancel_event=None):
+        """ファイルを順次投入し、完了したものから結果を返す
+        
+        未完了のfutureはmax_workersの4倍までに抑え、走査と解析を重ねつつメモリ使用量を一定に保つ
+        """
+        futures = {}
+        max_in_flight = self.max_workers * 4
         try:
-            with open(epub_path, 'rb') as f:
-                epub_splitter = SplitEpubWordTOC(f)
-                results = epub_splitter.generate_word_toc_output(
-                    output_dir=output_dir,
-                    format_type=format_type
-                )
-            return {'file': str(epub_path), 'results': results, 'status': 'success'}
+            for epub_file in epub_files:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                if len(futures) >= max_in_flight:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield self._collect(future, futures.pop(future))
+                future = executor.submit(_process_single_epub, epub_file, output_dir, format_type)
+                futures[future] = epub_file
+            
+            for future in as_completed(futures):
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                yield self._collect(future, futures.pop(future))
+        finally:
+            # 中断時（呼び出し側がループを抜けた場合も含む）は未着手のfutureを取り消す
+            for future in futures:
+                future.cancel()
+    
+    def _collect(self, future, epub_file):
+        """完了したfutureを結果の辞書に変換"""
+        try:
+            return future.result()
         except Exception as e:
-            return {'file': str(epub_path), 'error': str(e), 'status': 'error'}
+            # ワーカー自体の異常（プロセス停止など）
+            self.errors.append(str(e))
+            return {'file': str(epub_file), 'error': str(e), 'status': 'error'}
+    
+    def _iter_epubs(self, directory_path, recursive=True):
+        """os.scandirでディレクトリを走査し、EPUBファイルのパスを順次返す"""
+        self.discovery_done = False
+        if not os.path.isdir(directory_path):
+            self.discovery_done = True
+            return
+        
+        pending = deque([directory_path])
+        while pending:
+            try:
+                entries = os.scandir(pending.popleft())
+            except OSError as e:
+                # 読めないサブディレクトリ（権限なし・走査中の削除など）は飛ばして続行
+                logger.warning(f"ディレクトリを読み込めません: {e}")
+                continue
+            with entries:
+                for entry in entries:
+                    # DirEntryのキャッシュ済み情報を使うので追加のstatは発生しない
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            pending.append(entry.path)
+                    elif entry.name.lower().endswith('.epub') and entry.is_file(follow_symlinks=False):
+                        self.discovered += 1
+                        yield entry.path
+        self.discovery_done = True
+
+class _ReusableReader(io.RawIOBase):
+    """メモリ上のバッファ（mmapなど）の読み取り専用ストリーム（ZipFileに渡す用）"""
+    
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def readinto(self, b):
+        start = min(self._pos, len(self._view))
+        n = min(len(b), len(self._view) - start)
+        b[:n] = self._view[start:start + n]
+        self._pos = start + n
+        return n
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if pos < 0:
+            # 実ファイルと同じくOSErrorにする（ZipFileは短すぎるファイルをこれで判定する）
+            raise OSError(22, "Invalid argument")
+        self._pos = pos
+        return pos
+    
+    def tell(self):
+        return self._pos
+
+def _map_input(inputio):
+    """実ファイルのストリームならmmapしてZIPエントリの読み込みをメモリ参照にする
+    
+    ファイル記述子を持たないストリームや空ファイルはそのまま返す
+    """
+    try:
+        fileno = inputio.fileno()
+    except (AttributeError, OSError, ValueError):
+        return inputio
+    try:
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return inputio
+    # mmapはseekable()を持たない版があるのでリーダーで包む
+    return _ReusableReader(memoryview(mapped))
+
+def open_epub_stream(epub_path):
+    """EPUBファイルをmmapし、ZipFileに渡せる読み取り専用ストリームを返す
+    
+    ZIPの中央ディレクトリや各エントリへの細かいランダムreadを
+    ページキャッシュへのメモリ参照で処理させる。プロセス側に
+    ファイルサイズ分のバッファを持ち続けないので、常駐ワーカーでも
+    メモリを抱え込まない（ファイルを閉じてもマップは有効）。
+    mmapできないファイル（空ファイルなど）は内容を読み込んで返す
+    """
+    with open(epub_path, 'rb') as f:
+        stream = _map_input(f)
+        if stream is f:
+            return io.BytesIO(f.read())
+    return stream
+
+def _process_single_epub(epub_path, output_dir, format_type):
+    """単一EPUBファイルの処理（ProcessPoolExecutorから呼べるようモジュール関数として定義）"""
+    try:
+        epub_splitter = SplitEpubWordTOC(open_epub_stream(epub_path))
+        results = epub_splitter.generate_word_toc_output(
+            output_dir=output_dir,
+            format_type=format_type
+        )
+        return {'file': str(epub_path), 'results': results, 'status': 'success'}
+    except Exception as e:
+        return {'file': str(epub_path), 'error': str(e), 'status': 'error'}
 
 class EnhancedWordTOCGenerator:
     """改良版Word形式の目次レベル3段階出力ジェネレーター"""
     
+    # バッチ処理で並列に多数生成されるので、インスタンス辞書を持たせない
+    __slots__ = ('level1', 'level2', 'level3', 'current_level_1', 'current_level_2',
+                 'book_title', 'authors', 'calibre_detector', '_ts')
+    
     def __init__(self):
-        self.levels = {1: [], 2: [], 3: []}
+        self.level1 = []
+        self.level2 = []
+        self.level3 = []
         self.current_level_1 = None
         self.current_level_2 = None
         self.book_title = ""
         self.authors = []
         self.calibre_detector = CalibreCompatibleTOCDetector()
+        # 1回の生成内ではタイムスタンプは実質一定なので、エントリごとに整形しない
+        self._ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    @property
+    def levels(self):
+        """レベル番号 -> エントリリストの辞書（旧形式との互換用、リストは共有）"""
+        return {1: self.level1, 2: self.level2, 3: self.level3}
         
     def add_toc_entry(self, text, level, href="", anchor="", hierarchy_path="", detected_method="standard"):
         """目次エントリを追加（検出方法の記録付き）"""
@@ -229,21 +462,21 @@ class EnhancedWordTOCGenerator:
             'hierarchy_path': hierarchy_path,
             'level': level,
             'detected_method': detected_method,  # 検出方法を記録
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            'timestamp': self._ts
         }
         
         if level == 1:
             self.current_level_1 = text
             self.current_level_2 = None
-            self.levels[1].append(entry)
+            self.level1.append(entry)
         elif level == 2:
             self.current_level_2 = text
             entry['parent_level_1'] = self.current_level_1
-            self.levels[2].append(entry)
+            self.level2.append(entry)
         elif level == 3:
             entry['parent_level_1'] = self.current_level_1
             entry['parent_level_2'] = self.current_level_2
-            self.levels[3].append(entry)
+            self.level3.append(entry)
     
     def generate_enhanced_text_output(self):
         """改良版テキスト形式での目次出力"""
@@ -257,15 +490,16 @@ class EnhancedWordTOCGenerator:
         output.append("")
         
         # 検出統計
-        total_entries = sum(len(self.levels[i]) for i in range(1, 4))
+        levels = (self.level1, self.level2, self.level3)
+        total_entries = sum(len(entries) for entries in levels)
         output.append("🔍 検出統計")
         output.append("-" * 60)
         output.append(f"総エントリ数: {total_entries}")
         
         # 検出方法別の統計
         detection_stats = {}
-        for level in range(1, 4):
-            for entry in self.levels[level]:
+        for entries in levels:
+            for entry in entries:
                 method = entry.get('detected_method', 'unknown')
                 detection_stats[method] = detection_stats.get(method, 0) + 1
         
@@ -274,8 +508,8 @@ class EnhancedWordTOCGenerator:
         output.append("")
         
         # 各レベルの詳細
-        for level in range(1, 4):
-            if not self.levels[level]:
+        for level, entries in enumerate(levels, 1):
+            if not entries:
                 continue
                 
             level_names = {1: "📖 目次レベル1（大見出し）", 
@@ -285,7 +519,7 @@ class EnhancedWordTOCGenerator:
             output.append(level_names[level])
             output.append("-" * 60)
             
-            for i, entry in enumerate(self.levels[level], 1):
+            for i, entry in enumerate(entries, 1):
                 output.append(f"{i:2d}. {entry['text']}")
                 
                 # 親階層の表示
@@ -309,6 +543,8 @@ class EnhancedWordTOCGenerator:
         """改良版Word文書として目次を出力"""
         if not WORD_SUPPORT:
             raise ImportError("python-docx is required for Word output")
+        from docx import Document
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
             
         doc = Document()
         
@@ -331,11 +567,11 @@ class EnhancedWordTOCGenerator:
         stats_heading = doc.add_heading('📊 検出統計', level=1)
         stats_para = doc.add_paragraph()
         stats_para.add_run('レベル1エントリ数: ').bold = True
-        stats_para.add_run(str(len(self.levels[1])))
+        stats_para.add_run(str(len(self.level1)))
         stats_para.add_run('\nレベル2エントリ数: ').bold = True
-        stats_para.add_run(str(len(self.levels[2])))
+        stats_para.add_run(str(len(self.level2)))
         stats_para.add_run('\nレベル3エントリ数: ').bold = True
-        stats_para.add_run(str(len(self.levels[3])))
+        stats_para.add_run(str(len(self.level3)))
         
         doc.add_page_break()
         
@@ -344,13 +580,13 @@ class EnhancedWordTOCGenerator:
                       2: '📝 目次レベル2（中見出し）', 
                       3: '📄 目次レベル3（小見出し）'}
         
-        for level in range(1, 4):
-            if not self.levels[level]:
+        for level, entries in enumerate((self.level1, self.level2, self.level3), 1):
+            if not entries:
                 continue
                 
             level_heading = doc.add_heading(level_names[level], level=1)
             
-            for i, entry in enumerate(self.levels[level], 1):
+            for i, entry in enumerate(entries, 1):
                 para = doc.add_paragraph(style='List Number')
                 para.add_run(entry['text']).bold = True
                 
@@ -383,7 +619,7 @@ class SplitEpubWordTOC:
     """EPUB splitter with enhanced Word TOC output support v2.0"""
     
     def __init__(self, inputio):
-        self.epub = ZipFile(inputio, 'r')
+        self.epub = ZipFile(_map_input(inputio), 'r')
         self.content_dom = None
         self.content_relpath = None
         self.manifest_items = None
@@ -455,15 +691,24 @@ class SplitEpubWordTOC:
         """エンコーディング検出と処理"""
         try:
             # EPUBファイル内のエンコーディングをチェック
-            container = self.epub.read("META-INF/container.xml")
+            # 判定には先頭だけあれば十分なので、エントリ全体は展開しない
+            with self.epub.open("META-INF/container.xml") as fh:
+                container = fh.read(4096)
             if isinstance(container, bytes):
+                # XML宣言にエンコーディングがあればchardetを回さない
+                declared = _RE_XML_ENCODING.search(container, 0, 100)
+                if declared:
+                    logger.info(f"Declared encoding: {declared.group(1).decode('ascii', 'replace')}")
+                    return
                 detected = chardet.detect(container)
                 if detected['confidence'] > 0.7:
                     logger.info(f"Detected encoding: {detected['encoding']}")
         except:
             pass  # エンコーディング検出に失敗しても続行
     
-    def _sanitize_filename(self, filename):
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _sanitize_filename(filename):
         """ファイル名の無効文字を除去"""
         if not filename:
             return "unknown_book"
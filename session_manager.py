@@ -22,6 +22,7 @@ class ProjectSession:
         self.session_file = f".session_{self.session_id}.json"
         self.created_at = datetime.now().isoformat()
         self.current_dir = os.getcwd()
+        self._git_info = None  # (ブランチ, 最新コミット) のキャッシュ
         
         # セッション情報
         self.session_data = {
@@ -40,27 +41,40 @@ class ProjectSession:
     
     def get_git_branch(self):
         """現在のGitブランチを取得"""
-        try:
-            import subprocess
-            result = subprocess.run(['git', 'branch', '--show-current'], 
-                                  capture_output=True, text=True)
-            return result.stdout.strip() if result.returncode == 0 else "unknown"
-        except:
-            return "unknown"
+        return self._get_git_info()[0]
     
     def get_last_commit(self):
         """最新のコミット情報を取得"""
-        try:
-            import subprocess
-            result = subprocess.run(['git', 'log', '-1', '--oneline'], 
-                                  capture_output=True, text=True)
-            return result.stdout.strip() if result.returncode == 0 else "unknown"
-        except:
-            return "unknown"
+        return self._get_git_info()[1]
+    
+    def _get_git_info(self):
+        """ブランチと最新コミットを1回のgit呼び出しで取得（結果はキャッシュ）"""
+        if self._git_info is None:
+            branch = last_commit = "unknown"
+            try:
+                import subprocess
+                # 1行目: 参照名（"HEAD -> ブランチ, ..."）、2行目: "短縮ハッシュ 件名"
+                result = subprocess.run(['git', 'log', '-1', '--format=%D%n%h %s'],
+                                      capture_output=True, text=True)
+                if result.returncode == 0:
+                    refs, _, last_commit = result.stdout.strip('\n').partition('\n')
+                    branch = ""  # detached HEADでは git branch --show-current と同じく空
+                    for ref in refs.split(', '):
+                        if ref.startswith('HEAD -> '):
+                            branch = ref[len('HEAD -> '):]
+                else:
+                    # コミットがまだないリポジトリではgit logが失敗するので、ブランチ名だけ取得
+                    result = subprocess.run(['git', 'branch', '--show-current'],
+                                          capture_output=True, text=True)
+                    if result.returncode == 0:
+                        branch = result.stdout.strip()
+            except:
+                pass
+            self._git_info = (branch, last_commit)
+        return self._git_info
     
     def get_files_status(self):
         """プロジェクトファイルの状況を取得"""
-        files = {}
         project_files = [
             "README.md",
             "requirements.txt", 
@@ -70,16 +84,20 @@ class ProjectSession:
             ".gitignore"
         ]
         
-        for file_name in project_files:
-            if os.path.exists(file_name):
-                stat = os.stat(file_name)
-                files[file_name] = {
-                    "exists": True,
-                    "size": stat.st_size,
-                    "modified": datetime.fromtimestamp(stat.st_mtime).isoformat()
-                }
-            else:
-                files[file_name] = {"exists": False}
+        # 1回のディレクトリ走査で対象ファイルだけstatする（DirEntryのstatはキャッシュされる）
+        files = {file_name: {"exists": False} for file_name in project_files}
+        with os.scandir('.') as entries:
+            for entry in entries:
+                if entry.name in files:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # リンク切れのシンボリックリンクなどは存在しない扱い
+                    files[entry.name] = {
+                        "exists": True,
+                        "size": stat.st_size,
+                        "modified": datetime.fromtimestamp(stat.st_mtime).isoformat()
+                    }
         
         return files
     
@@ -122,7 +140,7 @@ class ProjectSession:
     
     def generate_resume_info(self):
         """再開用情報を生成"""
-        resume_info = f"""
+        parts = [f"""
 # 📋 プロジェクト継続情報
 
 ## 🆔 セッション情報
@@ -137,20 +155,23 @@ class ProjectSession:
 - **開発段階**: {self.session_data['development_stage']}
 
 ## ✅ 完了済みタスク
-"""
+"""]
+        # 行はリストに溜めて最後に1回だけ連結する
+        append = parts.append
         for task in self.session_data['completed_tasks']:
-            resume_info += f"- ✅ {task['task']} ({task['completed_at']})\n"
+            append(f"- ✅ {task['task']} ({task['completed_at']})\n")
         
-        resume_info += "\n## 📋 次のタスク\n"
+        append("\n## 📋 次のタスク\n")
+        priority_emojis = {"high": "🔴", "medium": "🟡", "low": "🟢"}
         for task in self.session_data['next_tasks']:
-            priority_emoji = {"high": "🔴", "medium": "🟡", "low": "🟢"}.get(task['priority'], "⚪")
-            resume_info += f"- {priority_emoji} {task['task']} (優先度: {task['priority']})\n"
+            priority_emoji = priority_emojis.get(task['priority'], "⚪")
+            append(f"- {priority_emoji} {task['task']} (優先度: {task['priority']})\n")
         
-        resume_info += "\n## 📝 メモ\n"
+        append("\n## 📝 メモ\n")
         for note in self.session_data['notes']:
-            resume_info += f"- 📝 {note['note']} ({note['timestamp']})\n"
+            append(f"- 📝 {note['note']} ({note['timestamp']})\n")
         
-        resume_info += f"""
+        append(f"""
 ## 🔄 再開方法
 
 ### Claude Code Action再開コマンド:
@@ -172,9 +193,9 @@ cat {self.session_file}
 作業ディレクトリ: {self.current_dir}
 現在の開発段階: {self.session_data['development_stage']}
 ```
-"""
+""")
         
-        return resume_info
+        return "".join(parts)
 
 def create_current_session():
     """現在のセッション情報を作成"""
@@ -4,22 +4,88 @@
 """
 EPUB目次解析ツール v2.0 - セットアップスクリプト
 Calibre互換版 - 必要なライブラリを自動インストールするスクリプト
+
+ダウンロードしたwheelは ~/.cache/epub-toc-analyzer/pip にキャッシュし、再セットアップ時に再利用する。
+キャッシュの場所は環境変数 PIP_CACHE_DIR で変更できる
 """
 
 import os
 import sys
 import subprocess
-import importlib
+import importlib.util
 from pathlib import Path
 
+def _pip_cache_dir():
+    """pipのキャッシュディレクトリ（PIP_CACHE_DIRが設定されていればそれを使う）
+    
+    作成できない場合（ホームが読み取り専用など）はNoneを返し、pipの既定に任せる
+    """
+    try:
+        cache_dir = Path(os.environ.get("PIP_CACHE_DIR")
+                         or Path.home() / ".cache" / "epub-toc-analyzer" / "pip")
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    except (OSError, RuntimeError):
+        # RuntimeErrorはホームディレクトリが解決できない場合
+        return None
+    return cache_dir
+
+def _pip_install(packages):
+    """pipでパッケージをまとめてインストール（失敗時はCalledProcessError）"""
+    # 入力待ちで止まらないようにし、ビルド不要なwheelを優先する
+    command = [sys.executable, "-m", "pip", "install", "--prefer-binary", "--no-input"]
+    cache_dir = _pip_cache_dir()
+    if cache_dir is not None:
+        command += ["--cache-dir", str(cache_dir)]
+    subprocess.check_call(command + list(packages))
+
 def install_package(package_name):
     """パッケージをインストール"""
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
+        _pip_install([package_name])
         return True
     except subprocess.CalledProcessError:
         return False
 
+def _install_and_report(package):
+    """パッケージを1つインストールして結果を表示"""
+    print(f"\\n📦 {package} をインストール中...")
+    ok = install_package(package)
+    if ok:
+        print(f"✅ {package} インストール完了")
+    else:
+        print(f"❌ {package} インストール失敗")
+    return ok
+
+def install_packages(packages):
+    """複数のパッケージをインストールし、成功数を返す
+    
+    まず1回のpip呼び出しでまとめてインストールし（pipの起動と依存解決が1回で済む）、
+    失敗した場合だけパッケージごとに再試行してどれが失敗したかを特定する。
+    個別の再試行は1つずつ実行する（同じ環境に複数のpipを同時に走らせると、
+    共通の依存パッケージのインストールで競合するため）
+    """
+    if not packages:
+        return 0
+    
+    print(f"\\n📦 {', '.join(packages)} をインストール中...")
+    try:
+        _pip_install(packages)
+    except subprocess.CalledProcessError:
+        print("⚠️  一括インストールに失敗したため、個別にインストールします")
+    else:
+        for package in packages:
+            print(f"✅ {package} インストール完了")
+        return len(packages)
+    
+    return sum(_install_and_report(package) for package in packages)
+
+def is_installed(import_name):
+    """パッケージがインポート可能か（モジュール本体は実行せずに確認）"""
+    try:
+        return importlib.util.find_spec(import_name) is not None
+    except (ImportError, ValueError):
+        return False
+
 def check_and_install_dependencies():
     """依存ライブラリのチェックとインストール"""
     print("📦 EPUB目次解析ツール v2.0 セットアップ (Calibre互換版)")
@@ -27,9 +93,7 @@ def check_and_install_dependencies():
     
     # 必要なライブラリのリスト
     required_packages = [
-        ("beautifulsoup4", "bs4", "HTML/XML解析用"),
         ("lxml", "lxml", "高速XML処理用"),
-        ("six", "six", "Python2/3互換性用"),
         ("python-docx", "docx", "Word文書生成用"),
         ("defusedxml", "defusedxml", "安全なXML処理用"),
         ("tqdm", "tqdm", "プログレスバー表示用"),
@@ -37,6 +101,7 @@ def check_and_install_dependencies():
     ]
     
     optional_packages = [
+        ("beautifulsoup4", "bs4", "崩れたHTMLの解析フォールバック用（オプション）"),
         ("jaconv", "jaconv", "日本語テキスト処理用（オプション）"),
         ("tkinterdnd2", "tkinterdnd2", "GUI版ドラッグ&ドロップ機能用（オプション）")
     ]
@@ -48,10 +113,9 @@ def check_and_install_dependencies():
     
     # 必須パッケージのチェック
     for package_name, import_name, description in required_packages:
-        try:
-            importlib.import_module(import_name)
+        if is_installed(import_name):
             print(f"✅ {package_name}: インストール済み ({description})")
-        except ImportError:
+        else:
             print(f"❌ {package_name}: 未インストール ({description})")
             missing_packages.append(package_name)
     
@@ -61,10 +125,9 @@ def check_and_install_dependencies():
     
     optional_missing = []
     for package_name, import_name, description in optional_packages:
-        try:
-            importlib.import_module(import_name)
+        if is_installed(import_name):
             print(f"✅ {package_name}: インストール済み ({description})")
-        except ImportError:
+        else:
             print(f"⚠️  {package_name}: 未インストール ({description})")
             optional_missing.append(package_name)
     
@@ -75,14 +138,7 @@ def check_and_install_dependencies():
         
         user_input = input("\\n続行しますか？ [Y/n]: ").strip().lower()
         if user_input in ['', 'y', 'yes']:
-            success_count = 0
-            for package in missing_packages:
-                print(f"\\n📦 {package} をインストール中...")
-                if install_package(package):
-                    print(f"✅ {package} インストール完了")
-                    success_count += 1
-                else:
-                    print(f"❌ {package} インストール失敗")
+            success_count = install_packages(missing_packages)
             
             print(f"\\n📊 インストール結果: {success_count}/{len(missing_packages)} 成功")
         else:
@@ -97,12 +153,7 @@ def check_and_install_dependencies():
         
         user_input = input("インストールしますか？ [y/N]: ").strip().lower()
         if user_input in ['y', 'yes']:
-            for package in optional_missing:
-                print(f"\\n📦 {package} をインストール中...")
-                if install_package(package):
-                    print(f"✅ {package} インストール完了")
-                else:
-                    print(f"❌ {package} インストール失敗")
+            install_packages(optional_missing)
     
     return len(missing_packages) == 0
 
@@ -14,43 +14,84 @@ import os
 import re
 import sys
 import json
+import heapq
+import functools
+import importlib.util
+import posixpath
+import zipfile
+from copy import deepcopy
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Tuple, Optional, Any
-from dataclasses import dataclass
+from typing import List, Dict, Tuple, Optional, Any, TYPE_CHECKING
+from dataclasses import dataclass, field
 from collections import defaultdict
+from urllib.parse import unquote
+from xml.sax.saxutils import escape
 
-# Word処理
-try:
-    from docx import Document
-    from docx.shared import Inches, Pt
-    from docx.enum.text import WD_ALIGN_PARAGRAPH
+if TYPE_CHECKING:
     from docx.document import Document as DocxDocument
-    from docx.text.paragraph import Paragraph
-    import docx2txt
-    WORD_SUPPORT = True
-except ImportError:
-    WORD_SUPPORT = False
 
-# PDF生成
-try:
-    from reportlab.lib.pagesizes import letter, A4
+# Word/PDF/EPUBの出力系ライブラリは読み込みが重いので、モジュール読み込み時には
+# 有無だけを確認し、実際のimportは使用時に_ensure_word()/_ensure_pdf()/_ensure_epub()で行う
+@functools.lru_cache(maxsize=None)
+def _has_modules(*names: str) -> bool:
+    """指定モジュールがすべてインポート可能か（モジュール本体は実行しない）"""
+    try:
+        return all(importlib.util.find_spec(name) is not None for name in names)
+    except (ImportError, ValueError):
+        return False
+
+def has_word() -> bool:
+    """Word処理（python-docx）が利用可能か"""
+    return _has_modules('docx')
+
+def has_pdf() -> bool:
+    """PDF生成（reportlab）が利用可能か"""
+    return _has_modules('reportlab')
+
+def has_epub() -> bool:
+    """EPUB生成（ebooklib）が利用可能か"""
+    return _has_modules('ebooklib')
+
+WORD_SUPPORT = has_word()
+PDF_SUPPORT = has_pdf()
+EPUB_SUPPORT = has_epub()
+
+# _ensure_*()で読み込んだ名前（読み込み前はNone）
+Document = None
+A4 = SimpleDocTemplate = RLParagraph = Spacer = PageBreak = None
+getSampleStyleSheet = ParagraphStyle = pdfmetrics = TTFont = None
+epub = None
+
+@functools.lru_cache(maxsize=None)
+def _ensure_word() -> None:
+    """python-docxを初回使用時に読み込む"""
+    if not has_word():
+        raise ImportError("python-docx is required for Word processing")
+    from docx import Document
+    globals().update(Document=Document)
+
+@functools.lru_cache(maxsize=None)
+def _ensure_pdf() -> None:
+    """reportlabを初回使用時に読み込む"""
+    if not has_pdf():
+        raise ImportError("reportlab is required for PDF export")
+    from reportlab.lib.pagesizes import A4
     from reportlab.platypus import SimpleDocTemplate, Paragraph as RLParagraph, Spacer, PageBreak
     from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
     from reportlab.pdfbase import pdfmetrics
     from reportlab.pdfbase.ttfonts import TTFont
-    PDF_SUPPORT = True
-except ImportError:
-    PDF_SUPPORT = False
+    globals().update(A4=A4, SimpleDocTemplate=SimpleDocTemplate, RLParagraph=RLParagraph,
+                     Spacer=Spacer, PageBreak=PageBreak, getSampleStyleSheet=getSampleStyleSheet,
+                     ParagraphStyle=ParagraphStyle, pdfmetrics=pdfmetrics, TTFont=TTFont)
 
-# EPUB生成
-try:
-    import ebooklib
+@functools.lru_cache(maxsize=None)
+def _ensure_epub() -> None:
+    """ebooklibを初回使用時に読み込む"""
+    if not has_epub():
+        raise ImportError("ebooklib is required for EPUB export")
     from ebooklib import epub
-    EPUB_SUPPORT = True
-except ImportError:
-    EPUB_SUPPORT = False
+    globals().update(epub=epub)
 
 # 既存v2.0モジュール
 try:
@@ -59,7 +100,83 @@ try:
 except ImportError:
     V2_SUPPORT = False
 
-@dataclass
+# 標準的な見出しスタイル
+_STD_HEADINGS = {
+    'Heading 1': 1, 'Heading 2': 2, 'Heading 3': 3,
+    'Heading 4': 4, 'Heading 5': 5, 'Heading 6': 6,
+    '見出し 1': 1, '見出し 2': 2, '見出し 3': 3,
+    'Title': 1, 'Subtitle': 2
+}
+
+# カスタムスタイルの検出（スタイル名パターンで判定、レベル1を優先）
+_CUSTOM_L1 = re.compile(r'(chapter|章|section|節)', re.IGNORECASE)
+_CUSTOM_L2 = re.compile(r'(subsection|小節|部)', re.IGNORECASE)
+
+# ファイル名のサニタイズ用パターン
+_INVALID_FN_RE = re.compile(r'[<>:"/\\|?*]')
+_WS_RE = re.compile(r'\s+')
+
+# 複製した段落から外す、元文書のリレーション（画像・ハイパーリンク等）への参照属性の名前空間
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_A_NS = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+_V_NS = '{urn:schemas-microsoft-com:vml}'
+# 複製先の文書にない部品（脚注・文末脚注・コメント・番号定義）をIDで参照する要素と、
+# 段落内のセクション設定（ヘッダー/フッター参照を含み、複製先で余計なセクション区切りになる）
+_DANGLING_TAGS = frozenset(_W_NS + name for name in (
+    'footnoteReference', 'endnoteReference',
+    'commentReference', 'commentRangeStart', 'commentRangeEnd',
+    'numPr', 'sectPr',
+))
+# リレーションIDの属性が省略可能な要素（属性だけ外せば妥当なまま残せる）
+_OPTIONAL_REL_TAGS = frozenset((
+    _A_NS + 'blip', _A_NS + 'hlinkClick', _A_NS + 'hlinkHover',
+    _W_NS + 'hyperlink', _V_NS + 'imagedata',
+))
+
+def _detach_relationships(element) -> None:
+    """別文書へ複製した要素から元文書の部品への参照を除去（壊れた参照を残さない）
+    
+    リレーションIDが省略可能な要素（画像・ハイパーリンク）は属性だけを外し、
+    IDが必須の要素（ヘッダー参照・グラフ・altChunkなど）と脚注・コメント・番号付けの
+    参照要素は丸ごと取り除く（残すとWordが「読み取れない内容」として修復を求める）
+    """
+    dangling = []
+    for node in element.iter():
+        if node.tag in _DANGLING_TAGS:
+            dangling.append(node)
+            continue
+        rel_attrs = [name for name in node.attrib if name.startswith(_REL_NS)]
+        if not rel_attrs:
+            continue
+        if node.tag in _OPTIONAL_REL_TAGS:
+            for name in rel_attrs:
+                del node.attrib[name]
+        else:
+            dangling.append(node)
+    for node in dangling:
+        parent = node.getparent()
+        if parent is not None:
+            parent.remove(node)
+
+def _heading_level(style_name: Optional[str]) -> Optional[int]:
+    """スタイル名から見出しレベルを判定（見出しでなければNone）"""
+    if not style_name:
+        return None
+    level = _STD_HEADINGS.get(style_name)
+    if level is not None:
+        return level
+    if _CUSTOM_L1.search(style_name):
+        return 1
+    if _CUSTOM_L2.search(style_name):
+        return 2
+    return None
+
+# Python 3.10以降はインスタンス辞書を持たない__slots__付きのデータクラスにする
+# （大きな目次で多数生成されるため、メモリ使用量と属性アクセスが軽くなる）
+_DATACLASS_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_DATACLASS_SLOTS)
 class TOCEntry:
     """目次エントリデータクラス"""
     text: str
@@ -70,6 +187,7 @@ class TOCEntry:
     parent_path: str = ""
     file_href: str = ""
     anchor: str = ""
+    full_path: str = field(init=False, default="", repr=False, compare=False)
     
     def __post_init__(self):
         if self.parent_path and self.text:
@@ -77,7 +195,7 @@ class TOCEntry:
         else:
             self.full_path = self.text
 
-@dataclass 
+@dataclass(**_DATACLASS_SLOTS)
 class SplitConfig:
     """分割設定データクラス"""
     split_level: int = 1  # 分割する目次レベル
@@ -88,6 +206,112 @@ class SplitConfig:
     filename_pattern: str = "{index:02d}_{title}"
     max_filename_length: int = 50
 
+# EPUBの目次解析（ナビゲーション文書/NCXだけを読む高速パス）で使う名前空間
+_OPF_CONTAINER_NS = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+_OPF_NS = '{http://www.idpf.org/2007/opf}'
+_NCX_NS = '{http://www.daisy.org/z3986/2005/ncx/}'
+_EPUB_TYPE = '{http://www.idpf.org/2007/ops}type'
+
+def _local_name(tag) -> str:
+    """名前空間を除いた要素名（コメント等の要素以外は空文字）"""
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+def _split_toc_href(base_dir: str, href: str) -> Tuple[str, str]:
+    """目次のhrefをZIP内パスとアンカーに分ける"""
+    path, _, anchor = href.partition('#')
+    if path:
+        path = posixpath.normpath(posixpath.join(base_dir, unquote(path)))
+    return path, anchor
+
+def _nav_entries(ol, base_dir: str, level: int, out: List[TOCEntry]) -> None:
+    """EPUB3ナビゲーション文書のol/liを文書順にたどってエントリを追加"""
+    for li in ol:
+        if _local_name(li.tag) != 'li':
+            continue
+        label = None
+        children = []
+        for child in li:
+            name = _local_name(child.tag)
+            if name in ('a', 'span') and label is None:
+                label = child
+            elif name == 'ol':
+                children.append(child)
+        if label is not None:
+            text = ' '.join(''.join(label.itertext()).split())
+            if text:
+                file_href, anchor = _split_toc_href(base_dir, label.get('href', ''))
+                out.append(TOCEntry(text=text, level=level, file_href=file_href, anchor=anchor))
+        for child in children:
+            _nav_entries(child, base_dir, level + 1, out)
+
+def _ncx_entries(parent, base_dir: str, level: int, out: List[TOCEntry]) -> None:
+    """EPUB2のNCXのnavPointを文書順にたどってエントリを追加"""
+    for nav_point in parent.iterchildren(_NCX_NS + 'navPoint'):
+        text = ' '.join((nav_point.findtext(f'{_NCX_NS}navLabel/{_NCX_NS}text') or '').split())
+        if text:
+            content = nav_point.find(_NCX_NS + 'content')
+            src = content.get('src', '') if content is not None else ''
+            file_href, anchor = _split_toc_href(base_dir, src)
+            out.append(TOCEntry(text=text, level=level, file_href=file_href, anchor=anchor))
+        _ncx_entries(nav_point, base_dir, level + 1, out)
+
+def _fast_epub_toc(epub_path: str) -> Optional[List[TOCEntry]]:
+    """container.xml・OPF・ナビゲーション文書（なければNCX）の3エントリだけを読んで目次を取得
+    
+    本文は展開しないので大きなEPUBでも数KBの読み込みで済む。
+    目次が取得できない・壊れている場合はNoneを返す（呼び出し側で通常の解析に切り替える）
+    """
+    try:
+        from lxml import etree
+    except ImportError:
+        return None
+    
+    parser = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
+    try:
+        with zipfile.ZipFile(epub_path, 'r') as epub_zip:
+            container = etree.fromstring(epub_zip.read('META-INF/container.xml'), parser)
+            rootfile = container.find(f'.//{_OPF_CONTAINER_NS}rootfile')
+            if rootfile is None or not rootfile.get('full-path'):
+                return None
+            opf_path = rootfile.get('full-path')
+            opf = etree.fromstring(epub_zip.read(opf_path), parser)
+            opf_dir = posixpath.dirname(opf_path)
+            
+            # EPUB3のナビゲーション文書を優先し、なければspineのtoc属性が指すNCXを使う
+            nav_href = ncx_href = None
+            items = {}
+            for item in opf.iterfind(f'{_OPF_NS}manifest/{_OPF_NS}item'):
+                items[item.get('id')] = item
+                if nav_href is None and 'nav' in (item.get('properties') or '').split():
+                    nav_href = item.get('href')
+                elif ncx_href is None and item.get('media-type') == 'application/x-dtbncx+xml':
+                    ncx_href = item.get('href')
+            spine = opf.find(_OPF_NS + 'spine')
+            if spine is not None and spine.get('toc') in items:
+                ncx_href = items[spine.get('toc')].get('href') or ncx_href
+            
+            entries: List[TOCEntry] = []
+            if nav_href:
+                nav_path = posixpath.normpath(posixpath.join(opf_dir, unquote(nav_href)))
+                nav_doc = etree.fromstring(epub_zip.read(nav_path), parser)
+                navs = [el for el in nav_doc.iter() if _local_name(el.tag) == 'nav']
+                toc_nav = next((nav for nav in navs if nav.get(_EPUB_TYPE) == 'toc'), navs[0] if navs else None)
+                if toc_nav is not None:
+                    nav_dir = posixpath.dirname(nav_path)
+                    for ol in toc_nav:
+                        if _local_name(ol.tag) == 'ol':
+                            _nav_entries(ol, nav_dir, 1, entries)
+            if not entries and ncx_href:
+                ncx_path = posixpath.normpath(posixpath.join(opf_dir, unquote(ncx_href)))
+                ncx = etree.fromstring(epub_zip.read(ncx_path), parser)
+                nav_map = ncx.find(_NCX_NS + 'navMap')
+                if nav_map is not None:
+                    _ncx_entries(nav_map, posixpath.dirname(ncx_path), 1, entries)
+    except (OSError, KeyError, ValueError, AttributeError, zipfile.BadZipFile, etree.LxmlError):
+        # recover=Trueでも解析できない文書はfromstringがNoneを返すのでAttributeErrorも対象
+        return None
+    return entries or None
+
 class DynamicTOCAnalyzer:
     """動的目次構造解析クラス"""
     
@@ -96,34 +320,49 @@ class DynamicTOCAnalyzer:
         self.level_stats: Dict[int, int] = defaultdict(int)
         self.max_depth = 0
         self.recommended_split_level = 1
+        # レベル -> toc_entries内のインデックス（分割点とプレビューで使用）
+        self.level_index: Dict[int, List[int]] = {}
+        self.document = None  # 解析したWord文書（分割時に再解析せず使い回せる）
         
     def analyze_word_document(self, docx_path: str) -> Dict[str, Any]:
         """Wordファイルの目次構造を解析"""
         if not WORD_SUPPORT:
             raise ImportError("python-docx is required for Word analysis")
+        _ensure_word()
             
         document = Document(docx_path)
+        self.document = document
         self.toc_entries = []
         self.level_stats = defaultdict(int)
         
-        # 見出しスタイルの検出
-        heading_styles = self._detect_heading_styles(document)
-        
-        # パラグラフ解析
+        # 段落は1回だけ走査し、見出しスタイルの判定もその場で行う
+        # （paragraph.styleはスタイル定義を毎回検索するので、段落のpStyle IDごとに
+        #   スタイル名と判定結果をキャッシュし、同じスタイルでは再検索・再判定しない）
+        style_levels: Dict[Optional[str], Tuple[str, Optional[int]]] = {}
+        # ループ内で使う属性・メソッドはローカルに束縛しておく
+        get_style = style_levels.get
+        append_entry = self.toc_entries.append
+        level_stats = self.level_stats
         for para_idx, paragraph in enumerate(document.paragraphs):
-            if paragraph.style.name in heading_styles:
-                level = heading_styles[paragraph.style.name]
-                text = paragraph.text.strip()
-                
-                if text:  # 空でない見出しのみ
-                    entry = TOCEntry(
-                        text=text,
-                        level=level,
-                        paragraph_index=para_idx,
-                        style_name=paragraph.style.name
-                    )
-                    self.toc_entries.append(entry)
-                    self.level_stats[level] += 1
+            style_id = paragraph._p.style
+            cached = get_style(style_id)
+            if cached is None:
+                style_name = paragraph.style.name
+                cached = style_levels[style_id] = (style_name, _heading_level(style_name))
+            style_name, level = cached
+            if level is None:
+                continue
+            
+            text = paragraph.text.strip()
+            if not text:  # 空でない見出しのみ
+                continue
+            append_entry(TOCEntry(
+                text=text,
+                level=level,
+                paragraph_index=para_idx,
+                style_name=style_name
+            ))
+            level_stats[level] += 1
         
         # 階層構造の構築
         self._build_hierarchy()
@@ -133,6 +372,17 @@ class DynamicTOCAnalyzer:
     
     def analyze_epub_toc(self, epub_path: str) -> Dict[str, Any]:
         """EPUBファイルの目次構造を解析"""
+        # まずナビゲーション文書/NCXだけを読む高速パスを試す（本文は展開しない）
+        entries = _fast_epub_toc(epub_path)
+        if entries:
+            self.toc_entries = entries
+            self.level_stats = defaultdict(int)
+            for entry in entries:
+                self.level_stats[entry.level] += 1
+            # エントリは文書順に並んでいるので、Wordと同じく親子関係を構築できる
+            self._build_hierarchy()
+            return self._generate_analysis_report()
+        
         if not V2_SUPPORT:
             raise ImportError("v2.0 modules required for EPUB analysis")
             
@@ -145,74 +395,60 @@ class DynamicTOCAnalyzer:
             self.level_stats = defaultdict(int)
             
             if epub_analyzer.toc_processor:
-                for level in range(1, 4):
-                    for entry in epub_analyzer.toc_processor.word_toc_generator.levels[level]:
-                        toc_entry = TOCEntry(
+                # レベルは固定の1〜3ではなく生成器が持つものをそのまま使う
+                levels = epub_analyzer.toc_processor.word_toc_generator.levels
+                for level, entries in levels.items():
+                    if not entries:
+                        continue
+                    self.level_stats[level] = len(entries)
+                    self.toc_entries.extend(
+                        TOCEntry(
                             text=entry['text'],
                             level=level,
                             file_href=entry.get('href', ''),
                             anchor=entry.get('anchor', ''),
                             parent_path=entry.get('hierarchy_path', '')
                         )
-                        self.toc_entries.append(toc_entry)
-                        self.level_stats[level] += 1
+                        for entry in entries
+                    )
         
+        self._build_level_index()
         return self._generate_analysis_report()
     
-    def _detect_heading_styles(self, document: DocxDocument) -> Dict[str, int]:
-        """見出しスタイルを検出してレベルにマッピング"""
-        heading_styles = {}
-        
-        # 標準的な見出しスタイル
-        standard_headings = {
-            'Heading 1': 1, 'Heading 2': 2, 'Heading 3': 3,
-            'Heading 4': 4, 'Heading 5': 5, 'Heading 6': 6,
-            '見出し 1': 1, '見出し 2': 2, '見出し 3': 3,
-            'Title': 1, 'Subtitle': 2
-        }
-        
-        # 使用されているスタイルを確認
-        used_styles = set()
-        for paragraph in document.paragraphs:
-            if paragraph.text.strip():
-                used_styles.add(paragraph.style.name)
-        
-        # 標準スタイルのマッピング
-        for style_name, level in standard_headings.items():
-            if style_name in used_styles:
-                heading_styles[style_name] = level
-        
-        # カスタムスタイルの検出（ヒューリスティック）
-        for style_name in used_styles:
-            if style_name not in heading_styles:
-                # スタイル名パターンで判定
-                if re.search(r'(chapter|章|section|節)', style_name, re.IGNORECASE):
-                    heading_styles[style_name] = 1
-                elif re.search(r'(subsection|小節|部)', style_name, re.IGNORECASE):
-                    heading_styles[style_name] = 2
-        
-        return heading_styles
+    def _build_level_index(self):
+        """レベルごとのエントリ位置の索引を作成"""
+        level_index = defaultdict(list)
+        for i, entry in enumerate(self.toc_entries):
+            level_index[entry.level].append(i)
+        self.level_index = dict(level_index)
     
     def _build_hierarchy(self):
         """階層構造を構築"""
+        self.level_index = {}
         if not self.toc_entries:
             return
             
-        # 親子関係の構築
-        stack = []  # (level, entry) のスタック
-        
-        for entry in self.toc_entries:
+        # 親子関係の構築（各エントリの親は、直前にある自分より浅いレベルのエントリ）
+        # レベルごとの索引も同じ走査で作る
+        stack = []  # 祖先エントリのスタック（レベルは単調増加）
+        push, pop = stack.append, stack.pop
+        level_index = defaultdict(list)
+        
+        for i, entry in enumerate(self.toc_entries):
+            level = entry.level
+            level_index[level].append(i)
             # 現在のレベル以上の要素をスタックから除去
-            while stack and stack[-1][0] >= entry.level:
-                stack.pop()
+            while stack and stack[-1].level >= level:
+                pop()
             
             # 親パスの構築
             if stack:
-                parent_entry = stack[-1][1]
-                entry.parent_path = parent_entry.full_path
-                entry.full_path = f"{entry.parent_path}/{entry.text}"
+                parent_path = stack[-1].full_path
+                entry.parent_path = parent_path
+                entry.full_path = f"{parent_path}/{entry.text}"
             
-            stack.append((entry.level, entry))
+            push(entry)
+        self.level_index = dict(level_index)
         
         # 統計更新
         self.max_depth = max(self.level_stats.keys()) if self.level_stats else 0
@@ -257,36 +493,45 @@ class DynamicTOCAnalyzer:
         }
         return report
     
+    def section_spans(self, split_level: int) -> List[Tuple[int, int, int]]:
+        """分割レベルでのセクションを(開始, 終了, 見出し)のエントリ位置で返す（終了は含まない）
+        
+        セクションは見出しの次にある、分割レベル以上（レベル値が同じか小さい）の見出しで終わる。
+        上位の見出しは直後の分割レベルのセクションの先頭に含め、分割レベルの見出しを
+        1つも持たない上位の見出しはそれ自体を1セクションとする（本文を落とさない）。
+        分割レベルの見出しがなければ空リストを返す
+        """
+        if not self.level_index.get(split_level):
+            return []
+        entries = self.toc_entries
+        # 区切りとなる見出し（分割レベル以上）の位置は、索引の各レベルの昇順リストをマージして得る
+        boundaries = list(heapq.merge(*(positions for level, positions in self.level_index.items()
+                                        if level <= split_level)))
+        ends = boundaries[1:] + [len(entries)]
+        
+        spans = []
+        carry = None  # 次のセクションの先頭に含める上位見出しの位置
+        for pos, end in zip(boundaries, ends):
+            if entries[pos].level < split_level and end < len(entries) and entries[end].level == split_level:
+                if carry is None:
+                    carry = pos
+                continue
+            spans.append((pos if carry is None else carry, end, pos))
+            carry = None
+        return spans
+    
     def _generate_split_preview(self) -> List[Dict]:
         """分割プレビューを生成"""
         preview = []
-        split_level = self.recommended_split_level
-        
-        current_section = None
-        subsections = []
-        
-        for entry in self.toc_entries:
-            if entry.level == split_level:
-                # 前のセクションを保存
-                if current_section:
-                    preview.append({
-                        'title': current_section.text,
-                        'subsections': len(subsections),
-                        'subsection_list': [s.text for s in subsections[:5]]  # 最初の5個のみ
-                    })
-                
-                # 新しいセクション開始
-                current_section = entry
-                subsections = []
-            elif entry.level > split_level and current_section:
-                subsections.append(entry)
-        
-        # 最後のセクション
-        if current_section:
+        entries = self.toc_entries
+        
+        # 分割時と同じ区切り方で、見出しから次の区切りまでを下位セクションとする
+        for _, end, heading in self.section_spans(self.recommended_split_level):
+            subsections = entries[heading + 1:end]
             preview.append({
-                'title': current_section.text,
+                'title': entries[heading].text,
                 'subsections': len(subsections),
-                'subsection_list': [s.text for s in subsections[:5]]
+                'subsection_list': [s.text for s in subsections[:5]]  # 最初の5個のみ
             })
         
         return preview
@@ -294,21 +539,28 @@ class DynamicTOCAnalyzer:
 class WordDocumentSplitter:
     """Wordファイル分割クラス"""
     
-    def __init__(self, analyzer: DynamicTOCAnalyzer):
+    def __init__(self, analyzer: DynamicTOCAnalyzer, document: Optional['DocxDocument'] = None):
         self.analyzer = analyzer
+        self._document = document  # 解析済みの文書が渡されれば分割時に再読み込みしない
         self.original_document = None
+        self._paragraphs = []  # 元文書の段落リスト（document.paragraphsは参照のたびに本文全体を走査するため）
         self.split_documents = []
         
     def split_document(self, docx_path: str, config: SplitConfig) -> List[str]:
         """Wordファイルを目次レベルに基づいて分割"""
         if not WORD_SUPPORT:
             raise ImportError("python-docx is required for Word splitting")
+        _ensure_word()
         
-        self.original_document = Document(docx_path)
+        if self._document is not None:
+            self.original_document = self._document
+        else:
+            self.original_document = Document(docx_path)
+        self._paragraphs = list(self.original_document.paragraphs)
         output_files = []
         
         # 分割ポイントの決定
-        split_points = self._determine_split_points(config.split_level)
+        split_points = self._determine_split_points(config.split_level, len(self._paragraphs))
         
         # 各セクションを分割
         for i, (start_idx, end_idx, title) in enumerate(split_points):
@@ -329,29 +581,22 @@ class WordDocumentSplitter:
         
         return output_files
     
-    def _determine_split_points(self, split_level: int) -> List[Tuple[int, int, str]]:
+    def _determine_split_points(self, split_level: int, paragraph_count: int) -> List[Tuple[int, int, str]]:
         """分割ポイントを決定"""
-        split_points = []
-        current_start = 0
-        
-        for i, entry in enumerate(self.analyzer.toc_entries):
-            if entry.level == split_level:
-                # 前のセクションを終了
-                if i > 0:  # 最初のエントリでない場合
-                    prev_end = entry.paragraph_index
-                    split_points.append((current_start, prev_end, prev_title))
-                
-                # 新しいセクション開始
-                current_start = entry.paragraph_index
-                prev_title = entry.text
-        
-        # 最後のセクション
-        if self.analyzer.toc_entries:
-            split_points.append((current_start, len(self.original_document.paragraphs), prev_title))
-        
+        # 区切り方は解析側のプレビューと共通（エントリ位置を段落位置に直す）
+        entries = self.analyzer.toc_entries
+        split_points = [
+            (entries[start].paragraph_index,
+             entries[end].paragraph_index if end < len(entries) else paragraph_count,
+             entries[heading].text)
+            for start, end, heading in self.analyzer.section_spans(split_level)
+        ]
+        # 最初の見出しより前の本文（前付け）は最初のセクションに含める
+        if split_points:
+            split_points[0] = (0,) + split_points[0][1:]
         return split_points
     
-    def _create_section_document(self, start_idx: int, end_idx: int, title: str, config: SplitConfig) -> DocxDocument:
+    def _create_section_document(self, start_idx: int, end_idx: int, title: str, config: SplitConfig) -> 'DocxDocument':
         """セクション文書を作成"""
         section_doc = Document()
         
@@ -359,19 +604,13 @@ class WordDocumentSplitter:
         title_para = section_doc.add_heading(title, level=1)
         
         # 元文書の段落をコピー
-        for i in range(start_idx, min(end_idx, len(self.original_document.paragraphs))):
-            original_para = self.original_document.paragraphs[i]
-            
+        body = section_doc.element.body
+        for original_para in self._paragraphs[start_idx:end_idx]:
             if config.preserve_formatting:
-                # 書式を保持してコピー
-                new_para = section_doc.add_paragraph()
-                new_para.style = original_para.style
-                
-                for run in original_para.runs:
-                    new_run = new_para.add_run(run.text)
-                    new_run.bold = run.bold
-                    new_run.italic = run.italic
-                    new_run.underline = run.underline
+                # 段落のXML要素を丸ごと複製して書式をすべて保持（python-docxでの段落複製の定石）
+                new_p = deepcopy(original_para._element)
+                _detach_relationships(new_p)
+                body.sectPr.addprevious(new_p)  # 本文末尾のセクション設定の直前に追加
             else:
                 # テキストのみコピー
                 section_doc.add_paragraph(original_para.text)
@@ -380,57 +619,74 @@ class WordDocumentSplitter:
     
     def _sanitize_filename(self, filename: str) -> str:
         """ファイル名の無効文字を除去"""
-        # 無効文字を除去
-        safe_name = re.sub(r'[<>:"/\\|?*]', '_', filename)
-        safe_name = re.sub(r'\s+', '_', safe_name)
-        safe_name = safe_name.strip('._')
-        
-        # 空の場合のデフォルト名
-        if not safe_name:
-            safe_name = "section"
-        
-        return safe_name
+        # 無効文字と空白を置換（空の場合はデフォルト名）
+        safe_name = _WS_RE.sub('_', _INVALID_FN_RE.sub('_', filename)).strip('._')
+        return safe_name or "section"
+
+@functools.lru_cache(maxsize=1)
+def _register_jp_font() -> Optional[str]:
+    """日本語フォントを登録して名前を返す（見つからない・登録できない場合はNone）"""
+    try:
+        # Windows環境での日本語フォント
+        font_paths = [
+            "C:/Windows/Fonts/msgothic.ttc",  # MS ゴシック
+            "C:/Windows/Fonts/meiryo.ttc",    # メイリオ
+        ]
+        for font_path in font_paths:
+            if os.path.exists(font_path):
+                pdfmetrics.registerFont(TTFont('Japanese', font_path))
+                return 'Japanese'
+    except:
+        pass  # フォント登録に失敗しても続行
+    return None
+
+def _section_body_markup(section: Dict) -> str:
+    """セクション本文をPDF用のParagraphマークアップにする（空なら空文字）"""
+    # 段落ごとにParagraphを作らず、改行で区切った1つのParagraphにまとめる
+    return '<br/><br/>'.join(escape(paragraph_text) for paragraph_text in section.get('content', []))
+
+def _section_chapter_html(section: Dict) -> str:
+    """セクションをEPUBの章HTMLにする（本文はエスケープして整形式を保つ）"""
+    parts = [f"<h1>{escape(section['title'])}</h1>"]
+    parts.extend(f"<p>{escape(paragraph_text)}</p>" for paragraph_text in section.get('content', []))
+    return "".join(parts)
 
 class MultiFormatExporter:
     """複数形式出力クラス"""
     
     def __init__(self, analyzer: DynamicTOCAnalyzer):
         self.analyzer = analyzer
+        self._pdf_body_style = None  # PDF本文用スタイル（初回のPDF出力時に作成）
     
     def export_to_pdf(self, content_sections: List[Dict], output_path: str) -> str:
         """PDF形式で出力"""
         if not PDF_SUPPORT:
             raise ImportError("reportlab is required for PDF export")
+        _ensure_pdf()
         
         doc = SimpleDocTemplate(output_path, pagesize=A4)
         styles = getSampleStyleSheet()
         story = []
         
-        # 日本語フォント設定（オプション）
-        try:
-            # Windows環境での日本語フォント
-            font_paths = [
-                "C:/Windows/Fonts/msgothic.ttc",  # MS ゴシック
-                "C:/Windows/Fonts/meiryo.ttc",    # メイリオ
-            ]
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    pdfmetrics.registerFont(TTFont('Japanese', font_path))
-                    break
-        except:
-            pass  # フォント登録に失敗しても続行
+        # 日本語フォント設定（オプション、登録はプロセスごとに1回だけ）
+        font_name = _register_jp_font()
+        if font_name:
+            styles['Title'].fontName = font_name
+        
+        if self._pdf_body_style is None:
+            self._pdf_body_style = ParagraphStyle('SectionBody', parent=styles['Normal'], spaceAfter=6)
+            if font_name:
+                self._pdf_body_style.fontName = font_name
         
         for section in content_sections:
             # セクションタイトル
-            title = RLParagraph(section['title'], styles['Title'])
+            title = RLParagraph(escape(section['title']), styles['Title'])
             story.append(title)
             story.append(Spacer(1, 12))
             
             # セクション内容
-            for paragraph_text in section.get('content', []):
-                para = RLParagraph(paragraph_text, styles['Normal'])
-                story.append(para)
-                story.append(Spacer(1, 6))
+            if section.get('content'):
+                story.append(RLParagraph(_section_body_markup(section), self._pdf_body_style))
             
             story.append(PageBreak())
         
@@ -441,6 +697,7 @@ class MultiFormatExporter:
         """EPUB形式で出力"""
         if not EPUB_SUPPORT:
             raise ImportError("ebooklib is required for EPUB export")
+        _ensure_epub()
         
         book = epub.EpubBook()
         
@@ -464,12 +721,7 @@ class MultiFormatExporter:
                 lang='ja'
             )
             
-            # HTML内容生成
-            content_html = f"<h1>{section['title']}</h1>"
-            for paragraph_text in section.get('content', []):
-                content_html += f"<p>{paragraph_text}</p>"
-            
-            chapter.set_content(content_html)
+            chapter.set_content(_section_chapter_html(section))
             book.add_item(chapter)
             spine.append(chapter)
             toc.append(epub.Link(chapter_filename, section['title'], f"chapter_{i+1}"))
@@ -501,7 +753,7 @@ def main():
     print("   report = analyzer.analyze_word_document('document.docx')")
     print("")
     print("2. 分割実行:")
-    print("   splitter = WordDocumentSplitter(analyzer)")
+    print("   splitter = WordDocumentSplitter(analyzer, document=analyzer.document)")
     print("   config = SplitConfig(split_level=1, output_format='word')")
     print("   files = splitter.split_document('document.docx', config)")
     print("")